@@ -1,13 +1,76 @@
+from functools import lru_cache
+from types import SimpleNamespace
+
 import numpy as np
-from scipy import interpolate
 from scipy import linalg
-from scipy import optimize
+
+# parameters that determine the solution of the model
+PAR_NAMES = ('rho','nu','kappa','beta','r','Delta','P_low','P_high')
+
+# cash-on-hand grids, which do not depend on the parameters (shared, so read-only)
+M1_GRID = np.linspace(1e-8,4,100)
+M2_GRID = np.linspace(1e-4,5,500)
+M1_GRID.setflags(write=False)
+M2_GRID.setflags(write=False)
+
+
+def interp_linear(x, xp, fp, dfdx=None):
+    """ 
+    linear interpolation on a 1d grid with linear extrapolation outside it
+    
+    Args:
+        x (ndarray): points to interpolate at
+        xp (ndarray): increasing grid points
+        fp (ndarray): function values at the grid points
+        dfdx (ndarray,optional): slopes of the segments, np.diff(fp)/np.diff(xp)
+    
+    Returns:
+        (ndarray): interpolated values
+    """
+    
+    # a. slopes of the segments
+    if dfdx is None:
+        dfdx = np.diff(fp)/np.diff(xp)
+    
+    # b. left grid point of the segment containing x (end segments outside the grid)
+    i = np.searchsorted(xp, x) - 1
+    i = np.clip(i, 0, dfdx.size-1)
+    
+    # c. affine within the segment
+    return fp[i] + dfdx[i]*(x-xp[i])
+
+
+@lru_cache(maxsize=32)
+def _solve_cached(par_tuple, dtype_name):
+    """ 
+    solve the model once for each set of parameter values and precision
+    
+    Args:
+        par_tuple (tuple): parameter values ordered as in PAR_NAMES
+        dtype_name (str): floating point type of the solution, 'float64' or 'float32'
+    
+    Returns:
+        (tuple): m1, v1, c1, m2, v2, c2 as read-only arrays
+    """
+    
+    # a. solve a model with these parameters, cast to the requested precision
+    dtype = np.dtype(dtype_name)
+    par = SimpleNamespace(**{name: dtype.type(x) for name, x in zip(PAR_NAMES, par_tuple)})
+    par.dtype = dtype
+    sol = ConsumptionSavingModel(par)._solve()
+    
+    # b. the arrays are shared between calls, so protect them
+    for x in sol:
+        x.setflags(write=False)
+    
+    return sol
+
 
 class ConsumptionSavingModel:
 
     def __init__(self, par):
         self.par = par
-        self.sim_m1 = []
+        self.sim_m1 = np.empty(0)
         self.data_m1 = []
         pass
 
@@ -25,8 +88,9 @@ class ConsumptionSavingModel:
             (float): utility of consumption   
         """
         
+        one_minus_rho = 1-self.par.rho
         
-        return c**(1-self.par.rho)/(1-self.par.rho)
+        return c**one_minus_rho/one_minus_rho
 
     def bequest(self,m,c):
         """ 
@@ -45,8 +109,9 @@ class ConsumptionSavingModel:
             (float): utility of bequest   
         """
         
+        one_minus_rho = 1-self.par.rho
         
-        return self.par.nu*(m-c+self.par.kappa)**(1-self.par.rho)/(1-self.par.rho)
+        return self.par.nu/one_minus_rho*(m-c+self.par.kappa)**one_minus_rho
 
     def v2(self,c2,m2):
         
@@ -66,40 +131,63 @@ class ConsumptionSavingModel:
         
         """
         
-        return self.utility(c2) + self.bequest(m2,c2)
+        # utility of consumption and bequest in one expression (same as utility(c2) + bequest(m2,c2))
+        one_minus_rho = 1-self.par.rho
+        
+        return (c2**one_minus_rho + self.par.nu*(m2-c2+self.par.kappa)**one_minus_rho)/one_minus_rho
+
+    def v2_interp(self,m2):
+        
+        """ 
+        linearly interpolated value function in period 2 (linear extrapolation outside the grid)
+        
+        Args:       
+            m2 (ndarray): cash-on-hand in beginning of period 2       
+        
+        Returns:       
+        
+            (ndarray): value function
+        
+        """
+        
+        return interp_linear(m2, self._m2_grid, self._v2_grid, self._dv2dm)
 
-    def v1(self,c1,m1,v2_interp):
+    def v1(self,c1,m1):
         
         
         """ post-decision value function in period 1   
         
         Args:            
-            m1 (float): cash-on-hand in the beginning of period 1 
-            c1 (float): consumption in period 1
+            m1 (ndarray): cash-on-hand in the beginning of period 1 
+            c1 (ndarray): consumption in period 1
             rho (float): CRRA parameter
             beta (float): discount factor       
             r (float): return on savings       
             Delta (float): income risk scale factor               
-            v2_interp (RegularGridInterpolator): interpolator for value function in period 2   
         
         Returns:       
         
             (ndarray): value-of-choice   
         """
         
-        # a. v2 value, if low income
-        m2_low = (1+self.par.r)*(m1-c1) + 1-self.par.Delta
-        v2_low = v2_interp([m2_low])[0]
+        # a. parameters
+        beta, r, Delta = self.par.beta, self.par.r, self.par.Delta
+        P_low, P_high = self.par.P_low, self.par.P_high
+        R, low_income, high_income = 1+r, 1-Delta, 1+Delta
+        
+        # b. cash-on-hand in period 2, if low and if high income
+        Ra1 = R*(m1-c1)
+        m2_low = Ra1 + low_income
+        m2_high = Ra1 + high_income
         
-        # b. v2 value, if high income
-        m2_high = (1+self.par.r)*(m1-c1) + 1+self.par.Delta
-        v2_high = v2_interp([m2_high])[0]
+        # c. v2 values for both income levels in one interpolation
+        v2_low, v2_high = self.v2_interp(np.stack((m2_low, m2_high)))
         
-        # c. expected v2 value
-        expected_v2 = self.par.P_low*v2_low + self.par.P_high*v2_high
+        # d. expected v2 value
+        expected_v2 = P_low*v2_low + P_high*v2_high
         
-        # d. total value
-        return self.utility(c1) + self.par.beta*expected_v2
+        # e. total value
+        return self.utility(c1) + beta*expected_v2
         
 
     def solve_period_2(self):
@@ -121,31 +209,25 @@ class ConsumptionSavingModel:
             c2s (ndarray): consumption function  
         """
 
-        # a. grids
-        m2s = np.linspace(1e-4,5,500)
-        v2s = np.empty(500)
-        c2s = np.empty(500)
+        # a. parameters
+        rho, nu, kappa = self.par.rho, self.par.nu, self.par.kappa
 
-        # b. solve for each m2 in grid
-        for i,m2 in enumerate(m2s):
+        # b. grids
+        m2s = M2_GRID.astype(self._dtype(), copy=False)
 
-            # i. objective
-            obj = lambda x: -self.v2(x[0],m2)
+        # c. closed-form solution from the FOC c2^(-rho) = nu*(m2-c2+kappa)^(-rho)
+        c2s = (m2s+kappa)/(1+nu**(1/rho))
 
-            # ii. initial value (consume half)
-            x0 = m2/2
+        # d. impose bounds (cannot die in debt)
+        c2s = np.clip(c2s,1e-8,m2s)
 
-            # iii. optimizer
-            result = optimize.minimize(obj,[x0],method='L-BFGS-B',bounds=((1e-8,m2),))
+        # e. value function
+        v2s = self.v2(c2s,m2s)
 
-            # iv. save
-            v2s[i] = -result.fun
-            c2s[i] = result.x
-            
         return m2s,v2s,c2s
     
 
-    def solve_period_1(self, v2_interp):
+    def solve_period_1(self):
         """ post-decision value function in period 1   
               
         
@@ -156,7 +238,6 @@ class ConsumptionSavingModel:
             beta (float): discount factor       
             r (float): return on savings       
             Delta (float): income risk scale factor               
-            v2_interp (RegularGridInterpolator): interpolator for value function in period 2  
         
         
         Returns:      
@@ -165,29 +246,37 @@ class ConsumptionSavingModel:
             c1s (ndarray): consumption function 
                                         
          """
-         # a. grids
-        m1s = np.linspace(1e-8, 4, 100)
-        v1s = np.empty(100)
-        c1s = np.empty(100)
-        
-        
-
-        # b. solve for each m1s in grid
-        for i, m1 in enumerate(m1s):
-
-            # i. objective
-            def obj(x): return -self.v1(x[0], m1, v2_interp)
-
-            # ii. initial guess (consume half)
-            x0 = m1/2
-
-            # iii. optimize
-            result = optimize.minimize(
-                obj, [x0], method='L-BFGS-B', bounds=((1e-12, m1+(1-self.par.Delta)/(1+self.par.r)),))
-
-            # iv. save
-            v1s[i] = -result.fun
-            c1s[i] = result.x[0]
+        # a. parameters
+        rho, beta, r, Delta = self.par.rho, self.par.beta, self.par.r, self.par.Delta
+        P_low, P_high = self.par.P_low, self.par.P_high
+        R, low_income, high_income = 1+r, 1-Delta, 1+Delta
+
+        # b. grids
+        dtype = self._dtype()
+        m1s = M1_GRID.astype(dtype, copy=False)
+        m2s = self._m2_grid
+        c2s = self._c2_grid
+
+        # c. end-of-period assets, keeping m2 inside the period 2 grid for both income levels
+        a1_min = (m2s[0]-low_income)/R
+        a1_max = (m2s[-1]-high_income)/R
+        a1s = np.linspace(a1_min, a1_max, 500, dtype=dtype)
+
+        # d. cash-on-hand in period 2, low income first and high income second
+        Ra1s = R*a1s
+        m2_next = np.concatenate((Ra1s + low_income, Ra1s + high_income))
+
+        # e. expected marginal value of cash-on-hand in period 2 (envelope condition: v2'(m2) = c2^(-rho))
+        v2_prime = interp_linear(m2_next, m2s, c2s)**(-rho)
+        expected_v2_prime = P_low*v2_prime[:a1s.size] + P_high*v2_prime[a1s.size:]
+
+        # f. invert the Euler equation on the endogenous grid
+        c1_endo = (beta*R*expected_v2_prime)**(-1/rho)
+        m1_endo = c1_endo + a1s
+
+        # g. interpolate consumption to the common grid and evaluate the value there
+        c1s = interp_linear(m1s, m1_endo, c1_endo)
+        v1s = self.v1(c1s, m1s)
 
         return m1s, v1s, c1s
     
@@ -204,6 +293,7 @@ class ConsumptionSavingModel:
             beta (float): discount factor       
             r (float): return on savings       
             Delta (float): income risk scale factor  
+            dtype (optional): floating point type of the solution, np.float64 (default) or np.float32
         
         Returns:   
             m1(ndarray): cash-on-hand in begining of period 1
@@ -215,17 +305,42 @@ class ConsumptionSavingModel:
 
         """
 
+        # a. solve, reusing the solution if the parameters have been solved before
+        par_tuple = tuple(float(getattr(self.par, name)) for name in PAR_NAMES)
+        m1, v1, c1, m2, v2, c2 = _solve_cached(par_tuple, self._dtype().name)
+
+        # b. store period 2 solution for interpolation
+        self._store_period_2(m2, v2, c2)
+
+        return m1, v1, c1, m2, v2, c2
+
+    def _solve(self):
+        
+        """ solve period 2 and then period 1 (see solve) """
+
         # a. solve period 2
         m2, v2, c2 = self.solve_period_2()
 
-        # b. construct interpolator
-        v2_interp = interpolate.RegularGridInterpolator([m2], v2,
-                                                        bounds_error=False, fill_value=None)
+        # b. store period 2 solution for interpolation
+        self._store_period_2(m2, v2, c2)
 
-        # b. solve period 1
-        m1, v1, c1 = self.solve_period_1(v2_interp)
+        # c. solve period 1
+        m1, v1, c1 = self.solve_period_1()
 
         return m1, v1, c1, m2, v2, c2
+
+    def _dtype(self):
+        
+        """ floating point type of the solution, par.dtype if set and float64 otherwise """
+
+        return np.dtype(getattr(self.par, 'dtype', np.float64))
+
+    def _store_period_2(self, m2, v2, c2):
+        
+        """ store the period 2 solution used by v2_interp, v1 and solve_period_1 """
+
+        self._m2_grid, self._v2_grid, self._c2_grid = m2, v2, c2
+        self._dv2dm = np.diff(v2)/np.diff(m2)
     
     def simulate(self):
         
@@ -233,7 +348,7 @@ class ConsumptionSavingModel:
         solves and interpolates simulated values
         
         Args:            
-            sim_m1 (float): simulated values of cash-on-hand in begining of period 1
+            sim_m1 (ndarray): simulated values of cash-on-hand in begining of period 1
             c2 (float): consumption in period 2     
             m2 (float): cash-on-hand in beginning of period 2       
             rho (float): CRRA parameter       
@@ -250,14 +365,11 @@ class ConsumptionSavingModel:
         # a. solve the model at current parameters
         m1, v1, c1, m2, v2, c2 = self.solve()
 
+        # b. draws of initial m as a contiguous array in the precision of the solution (also accepts lists)
+        sim_m1 = np.ascontiguousarray(self.sim_m1, dtype=c1.dtype)
 
-        # b. construct interpolaters
-        c1_interp1 = interpolate.RegularGridInterpolator([m1], c1,
-                                                        bounds_error=False, fill_value=None)
-
-    
         # c. sim period 1 based on draws of initial m and solution
-        sim_c1 = c1_interp1(self.sim_m1)
+        sim_c1 = interp_linear(sim_m1, m1, c1)
 
 
 